@@ -6,27 +6,305 @@ Este script muestra cómo:
 1. Recibir un evento de Slack (mention, reaction, etc.)
 2. Obtener el thread completo
 3. Enviarlo al Knowledge Agent via webhook
+
+Todo el I/O es asíncrono (aiohttp + AsyncWebClient), de modo que muchas
+ingestas pueden estar en vuelo a la vez sobre un único event loop.
 """
 
+import asyncio
+import collections
+import gzip
+import hashlib
+import hmac
+import logging
+import logging.handlers
 import os
-import requests
-from slack_sdk import WebClient
+import queue
+import sys
+import time
+from typing import Optional
+
+import aiohttp
+import orjson
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+from slack_sdk.web.async_client import AsyncWebClient
+
+try:
+    import zstandard
+except ImportError:  # Solo necesario con compression="zstd"
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Configurar logging sin bloquear el event loop
+
+    Los handlers solo encolan el registro (QueueHandler); un QueueListener en
+    un hilo aparte es quien escribe en stderr. El hilo no sobrevive a un
+    fork, así que hay que llamarla en cada proceso que escribe logs (en el
+    servidor, al arrancar cada worker).
+
+    Returns:
+        El listener ya arrancado (llamar a stop() para vaciar la cola)
+    """
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        logging.StreamHandler(),
+        respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    listener.start()
+    return listener
 
 
 class SlackToKnowledgeAgent:
-    def __init__(self, slack_token: str, knowledge_agent_url: str):
+    # Micro-batching de ingestas (opt-in): ventana de espera para agrupar threads
+    FLUSH_MS = 150
+    # Segundos antes de volver a descargar el directorio de usuarios (users.list)
+    USER_CACHE_TTL = 600
+    # event_id recientes recordados para descartar reintentos de Slack
+    SEEN_EVENTS_MAX = 100_000
+    # Reintentos hacia el Knowledge Agent. La ingesta no es idempotente, así que
+    # solo se reintenta cuando el agente seguro que no la procesó
+    MAX_RETRIES = 5
+    RETRY_BACKOFF = 0.3
+    RETRY_STATUSES = frozenset({429, 503})
+    # Retry-After máximo que se respeta; uno mayor se trata como error
+    MAX_RETRY_AFTER = 30
+
+    def __init__(self, slack_token: str, knowledge_agent_url: str,
+                 pool_maxsize: int = 64, compression: Optional[str] = None,
+                 max_batch: int = 1):
         """
         Inicializar el integrador
 
         Args:
             slack_token: Token del bot de Slack (xoxb-...)
             knowledge_agent_url: URL del Knowledge Agent (ej: http://localhost:8081)
+            pool_maxsize: Conexiones keep-alive máximas hacia el Knowledge Agent
+            compression: Content-Encoding del cuerpo ("zstd", "gzip" o None).
+                El Knowledge Agent (o su proxy) debe soportarlo; si responde
+                415 se vuelve a enviar sin comprimir.
+            max_batch: Threads máximos por POST. Con más de 1 se usa
+                intent: ingest_batch, que el Knowledge Agent debe implementar;
+                si no devuelve "results", cada thread se reenvía con intent: ingest.
+                Un thread ausente de "results" falla sin reenviarse.
         """
-        self.slack_client = WebClient(token=slack_token)
+        if compression not in (None, "zstd", "gzip"):
+            raise ValueError(f"Unsupported compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("compression='zstd' requires the zstandard package")
+        if max_batch < 1:
+            raise ValueError(f"max_batch must be >= 1, got {max_batch}")
+
+        self.slack_client = AsyncWebClient(token=slack_token)
+        # Ante un 429 de Slack, esperar lo que indique Retry-After y reintentar
+        self.slack_client.retry_handlers.append(
+            AsyncRateLimitErrorRetryHandler(max_retry_count=3)
+        )
         self.knowledge_agent_url = knowledge_agent_url.rstrip('/')
+        self._pool_maxsize = pool_maxsize
+        self._compression = compression
+        self._zstd = zstandard.ZstdCompressor(level=3) if compression == "zstd" else None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Envíos en vuelo, como mucho uno por conexión del pool
+        self._flush_tasks: set = set()
+        self._user_cache: dict[str, str] = {}
+        # None hasta la primera carga del directorio (monotonic() no empieza en 0)
+        self._user_cache_loaded_at: Optional[float] = None
+        self._user_refresh_task: Optional[asyncio.Task] = None
+        self._seen_events: collections.OrderedDict = collections.OrderedDict()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Obtener la sesión HTTP reutilizable hacia el Knowledge Agent
+
+        Se crea la primera vez que se usa (dentro del event loop) y se reutiliza
+        en todas las ingestas, evitando un handshake TCP/TLS por petición.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_maxsize,
+                limit_per_host=self._pool_maxsize,
+                keepalive_timeout=75
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Connection": "keep-alive"}
+            )
+        return self._session
+
+    async def close(self):
+        """Parar el envío por lotes, cerrar la sesión HTTP y liberar el pool"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for task in list(self._flush_tasks):
+            task.cancel()
+        if self._user_refresh_task is not None:
+            self._user_refresh_task.cancel()
+            self._user_refresh_task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def is_duplicate_event(self, event_id: str) -> bool:
+        """
+        Registrar un event_id de Slack y decir si ya se había visto
+
+        Slack reintenta un evento hasta 3 veces si no recibe un 2xx a tiempo;
+        los reintentos llevan el mismo event_id. Se recuerdan los últimos
+        SEEN_EVENTS_MAX ids (los más antiguos se descartan primero).
+
+        Args:
+            event_id: event_id del payload de Slack
+
+        Returns:
+            True si el evento ya se había recibido
+        """
+        if event_id in self._seen_events:
+            return True
+
+        self._seen_events[event_id] = time.time()
+        if len(self._seen_events) > self.SEEN_EVENTS_MAX:
+            self._seen_events.popitem(last=False)
+        return False
+
+    @staticmethod
+    def _display_name(user: dict) -> str:
+        """Nombre visible de un usuario de Slack, con fallback al username"""
+        profile = user.get("profile", {})
+        return (profile.get("display_name") or profile.get("real_name")
+                or user.get("name") or user.get("id", "unknown"))
+
+    async def _load_users(self):
+        """Descargar el directorio de usuarios (users.list paginado) a la caché"""
+        users = {}
+        cursor = None
+        while True:
+            result = await self.slack_client.users_list(limit=200, cursor=cursor)
+            for user in result["members"]:
+                users[user["id"]] = self._display_name(user)
+            cursor = result.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+
+        self._user_cache = users
+        self._user_cache_loaded_at = time.monotonic()
+
+    async def _resolve(self, user_id: str) -> str:
+        """
+        Resolver un usuario que no está en el directorio cacheado (users.info)
+
+        El resultado se memoiza hasta la siguiente recarga del directorio.
+        """
+        try:
+            result = await self.slack_client.users_info(user=user_id)
+            name = self._display_name(result["user"])
+        except SlackApiError as e:
+            logger.warning("Error resolving user %s: %s", user_id, e.response["error"])
+            name = user_id
+
+        self._user_cache[user_id] = name
+        return name
+
+    async def _reload_users(self):
+        """Recargar el directorio, sin propagar errores (corre en segundo plano)"""
+        try:
+            await self._load_users()
+        except Exception as e:
+            # No reintentar en cada thread: se cae a users.info hasta el próximo TTL
+            logger.warning("Error loading users: %s", e)
+            self._user_cache_loaded_at = time.monotonic()
+
+    async def _refresh_users(self):
+        """
+        Recargar el directorio de usuarios si ha expirado USER_CACHE_TTL
+
+        Solo la primera carga se espera. Después, al expirar, la recarga corre
+        en segundo plano y mientras tanto se sirve el directorio anterior, así
+        que un users.list largo no bloquea las ingestas.
+        """
+        loaded_at = self._user_cache_loaded_at
+        refreshing = self._user_refresh_task is not None and not self._user_refresh_task.done()
+        if not refreshing and (loaded_at is None
+                               or time.monotonic() - loaded_at > self.USER_CACHE_TTL):
+            self._user_refresh_task = asyncio.create_task(self._reload_users())
+
+        if self._user_cache_loaded_at is None and self._user_refresh_task is not None:
+            # Primera carga, compartida entre las llamadas concurrentes
+            await asyncio.shield(self._user_refresh_task)
+
+    async def resolve_user_names(self, user_ids: set) -> dict:
+        """
+        Obtener el nombre visible de varios usuarios
+
+        Usa un users.list cacheado durante USER_CACHE_TTL segundos, de modo que
+        un thread cuesta O(usuarios únicos) llamadas a Slack como mucho, y
+        normalmente ninguna.
+
+        Args:
+            user_ids: IDs de usuario de Slack
+
+        Returns:
+            Dict user_id → nombre visible
+        """
+        await self._refresh_users()
+        return await self._names_for(user_ids)
+
+    async def _names_for(self, user_ids: set) -> dict:
+        """Nombres visibles desde la caché actual, sin recargar el directorio"""
+        return {
+            uid: self._user_cache.get(uid) or await self._resolve(uid)
+            for uid in user_ids
+        }
+
+    async def _fetch_replies(self, channel_id: str, thread_ts: str) -> list:
+        """
+        Descargar todas las páginas de conversations.replies
+
+        La paginación de Slack es por cursor (cada página trae el cursor de la
+        siguiente), así que las páginas se piden en orden. El mensaje principal
+        se repite en cada página; se deduplica por ts.
+
+        Args:
+            channel_id: ID del canal de Slack
+            thread_ts: Timestamp del mensaje principal del thread
+
+        Returns:
+            Mensajes crudos de Slack ordenados por ts
+        """
+        by_ts = {}
+        cursor = None
+        while True:
+            result = await self.slack_client.conversations_replies(
+                channel=channel_id,
+                ts=thread_ts,
+                inclusive=True,  # Incluir el mensaje principal
+                limit=200,
+                cursor=cursor
+            )
+            for msg in result["messages"]:
+                by_ts[msg.get("ts", "")] = msg
+
+            cursor = result.get("response_metadata", {}).get("next_cursor")
+            if not result.get("has_more") or not cursor:
+                break
 
-    def fetch_thread(self, channel_id: str, thread_ts: str) -> dict:
+        return [by_ts[ts] for ts in sorted(by_ts, key=lambda ts: float(ts or 0))]
+
+    async def fetch_thread(self, channel_id: str, thread_ts: str) -> dict:
         """
         Obtener todos los mensajes de un thread
 
@@ -38,21 +316,28 @@ class SlackToKnowledgeAgent:
             Dict con la información del thread
         """
         try:
-            # Obtener todos los replies del thread
-            result = self.slack_client.conversations_replies(
-                channel=channel_id,
-                ts=thread_ts,
-                inclusive=True  # Incluir el mensaje principal
+            # Descargar el thread mientras se refresca el directorio de usuarios
+            replies, _ = await asyncio.gather(
+                self._fetch_replies(channel_id, thread_ts),
+                self._refresh_users()
             )
 
-            messages = []
-            for msg in result["messages"]:
-                messages.append({
+            # El directorio ya se refrescó en paralelo: solo resolver nombres
+            user_names = await self._names_for(
+                {m["user"] for m in replies if "user" in m}
+            )
+
+            # Proyección en una sola pasada: un dict por mensaje, sin copias intermedias
+            messages = [
+                {
                     "user": msg.get("user", "unknown"),
+                    "user_name": user_names.get(msg.get("user"), "unknown"),
                     "text": msg.get("text", ""),
                     "ts": msg.get("ts", ""),
                     "type": msg.get("type", "message")
-                })
+                }
+                for msg in replies
+            ]
 
             return {
                 "thread_ts": thread_ts,
@@ -61,41 +346,240 @@ class SlackToKnowledgeAgent:
             }
 
         except SlackApiError as e:
-            print(f"Error fetching thread: {e.response['error']}")
+            logger.error("Error fetching thread: %s", e.response["error"])
             raise
 
-    def send_to_knowledge_agent(self, thread_data: dict) -> dict:
+    async def _post(self, payload: dict) -> dict:
         """
-        Enviar thread al Knowledge Agent usando intent: ingest
+        POST de un payload al endpoint unificado /api/query
 
         Args:
-            thread_data: Dict con thread_ts, channel_id, y messages
+            payload: Cuerpo JSON de la petición
 
         Returns:
             Respuesta del Knowledge Agent
         """
         endpoint = f"{self.knowledge_agent_url}/api/query"
+        # Serializar una sola vez con orjson (más rápido que el json de la stdlib)
+        body = orjson.dumps(payload)
+
+        try:
+            if self._compression:
+                result = await self._send(endpoint, self._compress(body), self._compression)
+                if result is not None:
+                    return result
+                # El agente no acepta el Content-Encoding: seguir sin comprimir
+                logger.warning("Knowledge Agent rejected %s encoding, disabling compression",
+                               self._compression)
+                self._compression = None
+
+            return await self._send(endpoint, body)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("Error sending to Knowledge Agent: %s", e)
+            raise
 
+    def _compress(self, body: bytes) -> bytes:
+        """Comprimir el cuerpo con el Content-Encoding configurado"""
+        if self._compression == "zstd":
+            return self._zstd.compress(body)
+        return gzip.compress(body, compresslevel=6)
+
+    async def _send(self, endpoint: str, body: bytes,
+                    encoding: Optional[str] = None) -> Optional[dict]:
+        """
+        Enviar un cuerpo JSON ya serializado
+
+        Reintenta hasta MAX_RETRIES veces los fallos al conectar y los status
+        de RETRY_STATUSES (429/503: el agente rechazó la petición sin
+        procesarla), con backoff exponencial o, si el agente lo envía,
+        esperando lo indicado en Retry-After (si pide más de MAX_RETRY_AFTER
+        segundos se desiste, para no retener la ingesta). Un 500/502/504 o un corte de la
+        conexión después de enviar el cuerpo no se reintentan: el agente
+        podría haber creado ya las memories y se duplicarían.
+
+        Returns:
+            Respuesta del Knowledge Agent, o None si rechaza el Content-Encoding
+        """
+        headers = {"Content-Type": "application/json"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            delay = self.RETRY_BACKOFF * (2 ** attempt)
+            try:
+                async with self._get_session().post(
+                    endpoint,
+                    data=body,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    if encoding and response.status == 415:
+                        return None
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = int(retry_after)
+                    if (response.status in self.RETRY_STATUSES
+                            and attempt < self.MAX_RETRIES
+                            and delay <= self.MAX_RETRY_AFTER):
+                        logger.warning("Knowledge Agent returned %d, retrying in %.1fs",
+                                       response.status, delay)
+                    else:
+                        response.raise_for_status()
+                        return await response.json()
+
+            except aiohttp.ClientConnectorError as e:
+                if attempt == self.MAX_RETRIES:
+                    raise
+                logger.warning("Connection to Knowledge Agent failed (%s), retrying in %.1fs",
+                               e, delay)
+
+            await asyncio.sleep(delay)
+
+    async def send_to_knowledge_agent(self, thread_data: dict) -> dict:
+        """
+        Enviar thread al Knowledge Agent usando intent: ingest
+
+        Args:
+            thread_data: Dict con thread_ts, channel_id, y messages
+
+        Returns:
+            Respuesta del Knowledge Agent
+        """
         # Use the unified /api/query endpoint with intent: "ingest"
-        payload = {
+        return await self._post({
             "question": "Ingest this thread",
             "intent": "ingest",
             **thread_data
+        })
+
+    async def send_batch_to_knowledge_agent(self, threads: list) -> Optional[list]:
+        """
+        Enviar varios threads en una única petición usando intent: ingest_batch
+
+        Requiere un Knowledge Agent que implemente intent: ingest_batch y
+        devuelva {"results": [...]} con un resultado por thread, identificado
+        por channel_id y thread_ts (el ts solo es único dentro de un canal).
+        El agente de este repositorio no lo implementa.
+
+        Args:
+            threads: Lista de dicts con thread_ts, channel_id, y messages
+
+        Returns:
+            Respuesta para cada thread, en el mismo orden (None si falta), o
+            None si la respuesta no trae "results" (intent no reconocido)
+        """
+        response = await self._post({
+            "question": "Ingest these threads",
+            "intent": "ingest_batch",
+            "threads": threads
+        })
+
+        results = response.get("results")
+        if not isinstance(results, list):
+            return None
+
+        by_key = {
+            (r.get("channel_id"), r.get("thread_ts")): r
+            for r in results if isinstance(r, dict)
         }
+        return [by_key.get((t["channel_id"], t["thread_ts"])) for t in threads]
 
-        try:
-            response = requests.post(endpoint, json=payload, timeout=30)
-            response.raise_for_status()
-            return response.json()
+    async def _enqueue(self, thread_data: dict) -> dict:
+        """
+        Encolar un thread para el siguiente lote y esperar su resultado
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending to Knowledge Agent: {e}")
-            raise
+        Args:
+            thread_data: Dict con thread_ts, channel_id, y messages
+
+        Returns:
+            Respuesta del Knowledge Agent para ese thread
+        """
+        if self._flush_task is None or self._flush_task.done():
+            self._queue = asyncio.Queue()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((thread_data, future))
+        return await future
+
+    async def _flush_loop(self):
+        """
+        Agrupar los threads que llegan dentro de la ventana FLUSH_MS
+
+        El loop solo forma lotes: cada lote se envía en su propia tarea, con
+        hasta pool_maxsize envíos en vuelo. Si todos están ocupados, el loop
+        espera y los nuevos threads se acumulan en la cola para el siguiente lote.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self._pool_maxsize)
+        while True:
+            await semaphore.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.FLUSH_MS / 1000
+            while len(batch) < self._max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            task = asyncio.create_task(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+            task.add_done_callback(lambda _: semaphore.release())
+
+    async def _flush(self, batch: list):
+        """
+        Enviar un lote y resolver el future de cada thread
 
-    def ingest_thread(self, channel_id: str, thread_ts: str) -> dict:
+        Args:
+            batch: Lista de tuplas (thread_data, future)
+        """
+        threads = [thread_data for thread_data, _ in batch]
+        try:
+            if len(threads) == 1:
+                results = [await self.send_to_knowledge_agent(threads[0])]
+            else:
+                results = await self.send_batch_to_knowledge_agent(threads)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if results is None:
+            # El agente no reconoce ingest_batch: no ingirió nada, enviar uno a uno
+            logger.warning("Knowledge Agent does not support intent: ingest_batch, "
+                           "falling back to intent: ingest")
+            results = await asyncio.gather(
+                *(self.send_to_knowledge_agent(thread_data) for thread_data in threads),
+                return_exceptions=True
+            )
+
+        for (thread_data, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            elif result is None:
+                # El agente pudo haberlo ingerido: no reenviar (la ingesta no es idempotente)
+                future.set_exception(RuntimeError(
+                    f"No result for thread {thread_data['channel_id']}/"
+                    f"{thread_data['thread_ts']} in batch response"
+                ))
+            else:
+                future.set_result(result)
+
+    async def ingest_thread(self, channel_id: str, thread_ts: str) -> dict:
         """
         Pipeline completo: fetch thread de Slack y enviarlo al Knowledge Agent
 
+        Con max_batch > 1, los threads que llegan casi a la vez se agrupan en
+        un único POST.
+
         Args:
             channel_id: ID del canal de Slack
             thread_ts: Timestamp del thread
@@ -103,16 +587,16 @@ class SlackToKnowledgeAgent:
         Returns:
             Respuesta del Knowledge Agent
         """
-        print(f"Fetching thread {thread_ts} from channel {channel_id}...")
-        thread_data = self.fetch_thread(channel_id, thread_ts)
+        logger.info("Fetching thread %s from channel %s...", thread_ts, channel_id)
+        thread_data = await self.fetch_thread(channel_id, thread_ts)
 
-        print(f"Sending {len(thread_data['messages'])} messages to Knowledge Agent...")
-        result = self.send_to_knowledge_agent(thread_data)
+        logger.info("Sending %d messages to Knowledge Agent...", len(thread_data["messages"]))
+        result = await self._enqueue(thread_data)
 
-        print(f"✅ Success! {result.get('memories_added', 0)} memories created")
+        logger.info("✅ Success! %s memories created", result.get("memories_added", 0))
         return result
 
-    def post_confirmation(self, channel_id: str, thread_ts: str, memories_count: int):
+    async def post_confirmation(self, channel_id: str, thread_ts: str, memories_count: int):
         """
         Postear confirmación en el thread de Slack
 
@@ -122,140 +606,282 @@ class SlackToKnowledgeAgent:
             memories_count: Número de memories creadas
         """
         try:
-            self.slack_client.chat_postMessage(
+            await self.slack_client.chat_postMessage(
                 channel=channel_id,
                 thread_ts=thread_ts,
                 text=f"✅ Thread ingested to knowledge base! Created {memories_count} memories."
             )
         except SlackApiError as e:
-            print(f"Error posting confirmation: {e.response['error']}")
+            logger.error("Error posting confirmation: %s", e.response["error"])
 
 
 # =============================================================================
-# Ejemplo de uso con Flask (para recibir webhooks de Slack)
+# Ejemplo de uso con aiohttp.web (para recibir webhooks de Slack)
 # =============================================================================
 
-from flask import Flask, request, jsonify
+def verify_slack_request(headers, body: bytes, signing_secret: str):
+    """
+    Verificar la firma HMAC-SHA256 de una petición de Slack
+
+    Args:
+        headers: Cabeceras de la petición
+        body: Cuerpo crudo, antes de decodificarlo
+        signing_secret: Signing secret de la app de Slack
+
+    Raises:
+        ValueError: Si la firma falta, es inválida o la petición es antigua
+    """
+    if not signing_secret:
+        raise ValueError("SLACK_SIGNING_SECRET is not configured")
+
+    timestamp = headers.get("X-Slack-Request-Timestamp")
+    if not timestamp:
+        raise ValueError("missing X-Slack-Request-Timestamp header")
+
+    # Rechazar peticiones de hace más de 5 minutos (replay attacks)
+    try:
+        ts = int(timestamp)
+    except ValueError:
+        raise ValueError(f"invalid timestamp: {timestamp}")
+    if abs(time.time() - ts) > 300:
+        raise ValueError("timestamp too old or too far in future")
 
-app = Flask(__name__)
+    received_signature = headers.get("X-Slack-Signature")
+    if not received_signature:
+        raise ValueError("missing X-Slack-Signature header")
 
-# Configuración
-SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-KNOWLEDGE_AGENT_URL = os.getenv("KNOWLEDGE_AGENT_URL", "http://localhost:8081")
-SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+    base_string = b"v0:" + timestamp.encode() + b":" + body
+    expected_signature = "v0=" + hmac.new(
+        signing_secret.encode(), base_string, hashlib.sha256
+    ).hexdigest()
 
-integrator = SlackToKnowledgeAgent(SLACK_BOT_TOKEN, KNOWLEDGE_AGENT_URL)
+    # Comparación en tiempo constante
+    if not hmac.compare_digest(expected_signature, received_signature):
+        raise ValueError("signature verification failed")
 
 
-@app.route("/slack/events", methods=["POST"])
-def slack_events():
+def create_app():
     """
-    Endpoint para recibir eventos de Slack
+    Construir la aplicación aiohttp.web
+
+    aiohttp.web, la configuración del servidor y el integrador solo se cargan
+    aquí, de modo que importar este módulo (o usar el CLI) no paga ese coste.
+
+    En producción, servirla con varios workers (cada uno con su propio event
+    loop, pool de conexiones y listener de logging, creados al arrancar el
+    worker, así que --preload es seguro):
 
-    Configurar en Slack:
-    Event Subscriptions → Request URL: https://tu-dominio.com/slack/events
-    Subscribe to bot events: app_mention
+        gunicorn 'slack_webhook_example:create_app()' --bind 0.0.0.0:3000 \
+            --worker-class aiohttp.GunicornWebWorker --workers 4 --preload
     """
-    data = request.json
+    from aiohttp import web
 
-    # Verificación de URL de Slack
-    if "challenge" in data:
-        return jsonify({"challenge": data["challenge"]})
+    # Configuración
+    slack_bot_token = os.getenv("SLACK_BOT_TOKEN")
+    knowledge_agent_url = os.getenv("KNOWLEDGE_AGENT_URL", "http://localhost:8081")
+    slack_signing_secret = os.getenv("SLACK_SIGNING_SECRET")
+    knowledge_agent_compression = os.getenv("KNOWLEDGE_AGENT_COMPRESSION") or None
+    knowledge_agent_max_batch = int(os.getenv("KNOWLEDGE_AGENT_MAX_BATCH", "1"))
 
-    # Procesar eventos
-    if "event" in data:
-        event = data["event"]
+    if not slack_signing_secret:
+        logger.warning("SLACK_SIGNING_SECRET is not set: every Slack request will be rejected")
 
-        # Cuando mencionan el bot
-        if event.get("type") == "app_mention":
-            channel_id = event.get("channel")
-            thread_ts = event.get("thread_ts") or event.get("ts")
-            text = event.get("text", "").lower()
+    integrator = SlackToKnowledgeAgent(
+        slack_bot_token, knowledge_agent_url,
+        compression=knowledge_agent_compression,
+        max_batch=knowledge_agent_max_batch
+    )
 
-            # Si el mensaje contiene "ingest" o "save"
-            if "ingest" in text or "save" in text:
-                try:
-                    # Ingestar el thread
-                    result = integrator.ingest_thread(channel_id, thread_ts)
+    # Referencias a las tareas en segundo plano para que no se recolecten a medias
+    background_tasks = set()
 
-                    # Confirmar en Slack
-                    integrator.post_confirmation(
-                        channel_id,
-                        thread_ts,
-                        result.get("memories_added", 0)
-                    )
+    @web.middleware
+    async def slack_signature_middleware(request: web.Request, handler):
+        """
+        Rechazar con 401 cualquier petición sin firma válida de Slack
 
-                except Exception as e:
-                    print(f"Error processing thread: {e}")
-                    # Opcionalmente postear error en Slack
+        Se ejecuta antes que los handlers, sobre el cuerpo crudo, de modo que una
+        petición falsa no decodifica JSON ni dispara llamadas a Slack o al agente.
+        aiohttp cachea el cuerpo, así que los handlers pueden volver a leerlo.
+        """
+        body = await request.read()
+        try:
+            verify_slack_request(request.headers, body, slack_signing_secret)
+        except ValueError as e:
+            logger.warning("Signature verification failed: %s", e)
+            return web.json_response({"error": "Unauthorized"}, status=401)
 
-    return jsonify({"status": "ok"})
+        return await handler(request)
 
+    async def on_startup(app: web.Application):
+        """Arrancar el logging en el proceso que sirve (tras el fork del worker)"""
+        app["log_listener"] = setup_logging()
 
-@app.route("/slack/shortcuts", methods=["POST"])
-def slack_shortcuts():
-    """
-    Endpoint para Slack shortcuts/interactive components
+    async def on_cleanup(app: web.Application):
+        """Cerrar la sesión HTTP compartida y vaciar los logs al parar el servidor"""
+        await integrator.close()
+        app["log_listener"].stop()
 
-    Útil para crear un shortcut "Save to Knowledge Base"
-    """
-    payload = request.form.get("payload")
-    if not payload:
-        return jsonify({"error": "No payload"}), 400
+    async def process_event(data: dict):
+        """
+        Procesar un evento de Slack fuera del ciclo request/response
 
-    import json
-    data = json.loads(payload)
+        Args:
+            data: Payload del evento recibido en /slack/events
+        """
+        event = data["event"]
+
+        # Cuando mencionan el bot
+        if event.get("type") != "app_mention":
+            return
+
+        channel_id = event.get("channel")
+        thread_ts = event.get("thread_ts") or event.get("ts")
+        text = event.get("text", "").lower()
+
+        # Si el mensaje contiene "ingest" o "save"
+        if "ingest" in text or "save" in text:
+            try:
+                # Ingestar el thread
+                result = await integrator.ingest_thread(channel_id, thread_ts)
+
+                # Confirmar en Slack
+                await integrator.post_confirmation(
+                    channel_id,
+                    thread_ts,
+                    result.get("memories_added", 0)
+                )
+
+            except Exception as e:
+                logger.exception("Error processing thread: %s", e)
+                # Opcionalmente postear error en Slack
+
+    async def slack_events(request: web.Request) -> web.Response:
+        """
+        Endpoint para recibir eventos de Slack
 
-    if data.get("type") == "shortcut":
-        # Obtener información del mensaje
-        message = data.get("message", {})
-        channel_id = data["channel"]["id"]
-        thread_ts = message.get("thread_ts") or message.get("ts")
+        Responde 200 inmediatamente y procesa el evento en segundo plano: Slack
+        reintenta (y duplica ingestas) si no recibe respuesta en 3 segundos.
 
+        Configurar en Slack:
+        Event Subscriptions → Request URL: https://tu-dominio.com/slack/events
+        Subscribe to bot events: app_mention
+        """
+        # Cuerpo ya leído (y cacheado) por el middleware de firma
         try:
-            # Ingestar
-            result = integrator.ingest_thread(channel_id, thread_ts)
+            data = orjson.loads(await request.read())
+        except orjson.JSONDecodeError:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+
+        # Verificación de URL de Slack
+        if "challenge" in data:
+            return web.json_response({"challenge": data["challenge"]})
+
+        # Descartar reintentos de Slack antes de hacer ningún I/O
+        event_id = data.get("event_id")
+        if event_id and integrator.is_duplicate_event(event_id):
+            return web.json_response({"status": "dup"})
+
+        # Procesar eventos
+        if "event" in data:
+            task = asyncio.create_task(process_event(data))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+        return web.json_response({"status": "ok"})
+
+    async def slack_shortcuts(request: web.Request) -> web.Response:
+        """
+        Endpoint para Slack shortcuts/interactive components
 
-            # Responder al shortcut
-            return jsonify({
-                "text": f"✅ Thread saved! Created {result.get('memories_added', 0)} memories."
-            })
+        Útil para crear un shortcut "Save to Knowledge Base"
+        """
+        form = await request.post()
+        payload = form.get("payload")
+        if not payload:
+            return web.json_response({"error": "No payload"}, status=400)
 
-        except Exception as e:
-            return jsonify({
-                "text": f"❌ Error: {str(e)}"
-            }), 500
+        try:
+            data = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            return web.json_response({"error": "Invalid payload"}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({"error": "Invalid payload"}, status=400)
+
+        if data.get("type") == "shortcut":
+            # Obtener información del mensaje
+            message = data.get("message", {})
+            channel_id = data["channel"]["id"]
+            thread_ts = message.get("thread_ts") or message.get("ts")
+
+            try:
+                # Ingestar
+                result = await integrator.ingest_thread(channel_id, thread_ts)
+
+                # Responder al shortcut
+                return web.json_response({
+                    "text": f"✅ Thread saved! Created {result.get('memories_added', 0)} memories."
+                })
+
+            except Exception as e:
+                return web.json_response({
+                    "text": f"❌ Error: {str(e)}"
+                }, status=500)
+
+        return web.json_response({"status": "ok"})
 
-    return jsonify({"status": "ok"})
+    app = web.Application(middlewares=[slack_signature_middleware])
+    app.router.add_post("/slack/events", slack_events)
+    app.router.add_post("/slack/shortcuts", slack_shortcuts)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
 
 
 # =============================================================================
 # Ejemplo de uso directo (sin webhooks)
 # =============================================================================
 
+async def run_cli(channel: str, thread: str) -> dict:
+    """Ingestar un único thread desde la línea de comandos"""
+    integrator = SlackToKnowledgeAgent(
+        slack_token=os.getenv("SLACK_BOT_TOKEN"),
+        knowledge_agent_url=os.getenv("KNOWLEDGE_AGENT_URL", "http://localhost:8081"),
+        compression=os.getenv("KNOWLEDGE_AGENT_COMPRESSION") or None
+    )
+    try:
+        return await integrator.ingest_thread(channel, thread)
+    finally:
+        await integrator.close()
+
+
 if __name__ == "__main__":
     # Uso del integrator directamente
-    if len(os.sys.argv) > 2:
-        channel = os.sys.argv[1]
-        thread = os.sys.argv[2]
-
-        integrator = SlackToKnowledgeAgent(
-            slack_token=os.getenv("SLACK_BOT_TOKEN"),
-            knowledge_agent_url=os.getenv("KNOWLEDGE_AGENT_URL", "http://localhost:8081")
-        )
+    if len(sys.argv) > 2:
+        channel = sys.argv[1]
+        thread = sys.argv[2]
 
+        log_listener = setup_logging()
         try:
-            result = integrator.ingest_thread(channel, thread)
+            result = asyncio.run(run_cli(channel, thread))
             print(f"\n✅ Success!")
             print(f"Memories created: {result.get('memories_added', 0)}")
             print(f"Message: {result.get('message', 'N/A')}")
 
         except Exception as e:
             print(f"\n❌ Error: {e}")
-            exit(1)
+            sys.exit(1)
+
+        finally:
+            log_listener.stop()
 
     else:
-        # Modo servidor Flask
-        print("Starting Flask server for Slack webhooks...")
+        # Modo servidor aiohttp (un solo proceso; ver create_app() para gunicorn)
+        from aiohttp import web
+
+        app = create_app()
+        print("Starting aiohttp server for Slack webhooks...")
         print("Configure Slack Event URL: http://your-domain.com/slack/events")
-        app.run(host="0.0.0.0", port=3000, debug=True)
+        web.run_app(app, host="0.0.0.0", port=3000)